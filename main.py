@@ -4,19 +4,83 @@ Git Activity to CSV Converter
 Task: Convert git logs from multiple projects to a consolidated CSV file
 """
 
+import io
+import contextlib
 import os
 import csv
 import subprocess
+import tempfile
 import re
 import argparse
 import json
+import queue
+import functools
+from collections import defaultdict, namedtuple
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
 from dotenv import load_dotenv
 
+try:
+    import orjson
+except ImportError:  # optional, speeds up large project lists
+    orjson = None
+
 # Load environment variables
 load_dotenv()
 
+# Default number of repositories processed in parallel
+DEFAULT_JOBS = min(32, (os.cpu_count() or 1) * 2)
+
+# Read buffer size for the git log pipe
+GIT_LOG_BUFSIZE = 1024 * 1024
+
+# Write buffer size for the CSV output file
+CSV_BUFSIZE = 1024 * 1024
+
+# git log pretty format: hash, author name, author email, date, subject
+GIT_LOG_FORMAT = '%H%x1f%an%x1f%ae%x1f%ai%x1f%s'
+FIELD_SEPARATOR = b'\x1f'
+RECORD_SEPARATOR = b'\x00'
+
+# One CSV row; field order matches the output columns
+Commit = namedtuple('Commit', ['commit_hash', 'author_name', 'author_email', 'date',
+                               'Application_type', 'Description_Technical', 'project_path'])
+
+# Sidecar file used by --incremental, kept next to the CSV output
+CACHE_FILE = 'output/.gitcsv_cache.json'
+
+# Environment for git subprocesses: skip optional lock files (e.g. the index
+# refresh) and never set up a pager
+GIT_ENV = dict(os.environ, GIT_OPTIONAL_LOCKS='0', GIT_PAGER='cat')
+
+# Keeps each commit message on a single CSV line
+NEWLINE_TO_SPACE = str.maketrans({'\n': ' ', '\r': ' '})
+
+# Maximum number of parsed commit batches a repository may have waiting to be
+# written to the CSV (one batch per pipe read, so at most this many
+# GIT_LOG_BUFSIZE reads)
+COMMIT_QUEUE_SIZE = 16
+
+# Queued by a worker once it has finished with its repository
+_REPO_DONE = object()
+
+# How often a worker blocked on a full queue checks whether to stop
+QUEUE_PUT_TIMEOUT = 0.1
+
+# Running git log processes, so they can be killed on interrupt
+_git_processes = set()
+_git_processes_lock = threading.Lock()
+
+# Serialize console output from worker threads
+_print_lock = threading.Lock()
+
+def log(message):
+    """Print a message without interleaving output from other threads"""
+    with _print_lock:
+        print(message)
+
 def format_date_without_timezone(date_str):
     """Remove timezone from date string (e.g., '2025-09-10 12:38:03 +0700' -> '2025-09-10 12:38:03')"""
     try:
@@ -30,11 +94,16 @@ def format_date_without_timezone(date_str):
         # Return original string if parsing fails
         return date_str
 
+@functools.lru_cache(maxsize=1)
 def get_author_filters():
     """Get author name filters from environment variable"""
     author_names = os.getenv('author_name', '')
     return [name.strip() for name in author_names.split(',') if name.strip()]
 
+def escape_ere(text):
+    """Escape a literal string for use in a POSIX extended regular expression"""
+    return re.sub(r'([\\.^$|?*+()\[\]{}])', r'\\\1', text)
+
 def parse_date(date_str):
     """Parse date string in YYYY-MM-DD format"""
     try:
@@ -67,18 +136,79 @@ def validate_date_args(args):
     # No date filter
     return None, None, 'all'
 
+def build_date_args(start_date, end_date, date_mode):
+    """Build the git log --since/--until arguments for the date filter"""
+    if date_mode == 'today':
+        # Let git resolve the start of the day itself, but keep the end of
+        # the day as the upper bound so future-dated commits stay out
+        return ['--since', 'midnight', '--until', f'{end_date} 23:59:59']
+    
+    date_args = []
+    if start_date:
+        date_args.extend(['--since', f'{start_date} 00:00:00'])
+    if end_date:
+        date_args.extend(['--until', f'{end_date} 23:59:59'])
+    return date_args
+
 def read_project_list(file_path):
     """Read project directories and metadata from list_project.json"""
+    try:
+        mtime = os.stat(file_path).st_mtime_ns
+    except OSError:
+        # Let the reader report the problem
+        mtime = None
+    return _read_project_list(file_path, mtime)
+
+def load_json_file(file_path):
+    """Parse a JSON file, using orjson when it is installed"""
+    with open(file_path, 'rb') as f:
+        content = f.read()
+    if orjson is not None:
+        # orjson.JSONDecodeError subclasses json.JSONDecodeError
+        return orjson.loads(content)
+    return json.loads(content)
+
+def find_existing_paths(paths):
+    """Return the paths that exist, listing shared parent directories only once"""
+    paths_by_parent = defaultdict(list)
+    for path in paths:
+        if path:
+            paths_by_parent[os.path.dirname(path)].append(path)
+    
+    existing = set()
+    for parent, children in paths_by_parent.items():
+        directories = set()
+        # One directory listing is cheaper than a stat per sibling project.
+        # is_dir() follows symlinks, so broken links are not listed.
+        if len(children) > 1:
+            try:
+                with os.scandir(parent or '.') as entries:
+                    directories = {entry.name for entry in entries if entry.is_dir()}
+            except OSError:
+                pass
+        
+        for path in children:
+            # Anything the listing did not confirm (a file, a name differing
+            # only in case, an unlistable parent) gets the exact check
+            if os.path.basename(path) in directories or os.path.exists(path):
+                existing.add(path)
+    return existing
+
+@functools.lru_cache(maxsize=8)
+def _read_project_list(file_path, mtime):
+    """Read list_project.json, cached until the file's modification time changes"""
     projects = []
     project_mapping = {}  # For mapping project path to application type
     
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            
+        data = load_json_file(file_path)
+        
+        existing_paths = find_existing_paths(
+            project.get('path', '').rstrip('/') for project in data)
+        
         for project in data:
             project_path = project.get('path', '').rstrip('/')
-            if project_path and os.path.exists(project_path):
+            if project_path and project_path in existing_paths:
                 projects.append(project_path)
                 # Create mapping from project path to project name for Application_type
                 project_mapping[project_path] = project.get('name', '')
@@ -96,98 +226,268 @@ def read_project_list(file_path):
         print(f"Error reading {file_path}: {str(e)}")
         return [], {}
 
+def iter_git_record_batches(stream):
+    """Yield lists of NUL-terminated records from the output of a git -z command"""
+    pending = b''
+    while True:
+        chunk = stream.read1(GIT_LOG_BUFSIZE)
+        if not chunk:
+            break
+        records = (pending + chunk).split(RECORD_SEPARATOR)
+        # The last piece is the start of a record cut off at the chunk
+        # boundary, or empty when the chunk ended on a terminator
+        pending = records.pop()
+        if records:
+            yield records
+
+@functools.lru_cache(maxsize=None)
 def is_git_repository(path):
-    """Check if the given path is a git repository"""
-    try:
-        result = subprocess.run(['git', 'rev-parse', '--git-dir'], 
-                              cwd=path, capture_output=True, text=True)
-        return result.returncode == 0
-    except:
-        return False
-
-def get_git_log(repo_path, author_filters, project_mapping, start_date=None, end_date=None):
-    """Get git log for specified authors from a repository"""
-    if not is_git_repository(repo_path):
-        print(f"Warning: {repo_path} is not a git repository")
-        return []
-    
+    """Check if the given path is inside a git repository without spawning git"""
+    repo = Path(path).absolute()
+    # Bare repository
+    if (repo / 'HEAD').exists() and (repo / 'objects').is_dir() and (repo / 'refs').is_dir():
+        return True
+    # Like git itself, accept any directory inside a working tree
+    for directory in (repo, *repo.parents):
+        dotgit = directory / '.git'
+        if dotgit.is_dir() and (dotgit / 'HEAD').exists():
+            return True
+        if dotgit.is_file():
+            # gitfile pointing elsewhere (worktree or submodule)
+            return True
+    return False
+
+def parse_git_log_records(records, application_type, repo_path):
+    """Parse git log records into Commit rows"""
     commits = []
+    for record in records:
+        parts = record.split(FIELD_SEPARATOR, 4)
+        if len(parts) == 5:
+            commit_hash, author_name, author_email, date, message = parts
+            # Format date to remove timezone
+            formatted_date = format_date_without_timezone(date.decode('ascii'))
+            # Hashes and ISO dates are plain ASCII; only names, emails
+            # and messages need the UTF-8 codec
+            commits.append(Commit(commit_hash.decode('ascii'),
+                                  author_name.decode('utf-8', 'replace'),
+                                  author_email.decode('utf-8', 'replace'),
+                                  formatted_date,
+                                  application_type,
+                                  message.decode('utf-8', 'replace').translate(NEWLINE_TO_SPACE),
+                                  repo_path))
+    return commits
+
+def get_git_log(repo_path, author_filters, project_mapping, date_args=(), revisions=()):
+    """Yield batches of commits for specified authors from a repository as git produces them.
     
-    try:
-        # Build git log command with author filters
-        cmd = ['git', 'log', '--pretty=format:%H|%an|%ae|%ai|%s']
+    Raises subprocess.CalledProcessError if git log fails, so callers can tell
+    a failed run from a repository without matching commits.
+    """
+    # Build git log command with author filters
+    # Records are NUL terminated (-z with tformat) and fields
+    # unit-separator (0x1f) separated, so names and messages may safely
+    # contain '|'
+    cmd = ['git', 'log', '-z', f'--pretty=tformat:{GIT_LOG_FORMAT}']
+    
+    # Add date filters if specified
+    cmd.extend(date_args)
+    
+    # Restrict the history walk, e.g. to commits since the last run
+    cmd.extend(revisions)
+    
+    # If author filters are specified, match any of them with a single
+    # alternation so git walks the history once
+    if author_filters:
+        author_pattern = '|'.join(escape_ere(author) for author in author_filters)
+        cmd.extend(['--extended-regexp', f'--author={author_pattern}'])
+    
+    # Get application type from project mapping
+    application_type = project_mapping.get(repo_path, '')
+    
+    # stderr goes to a file rather than a pipe: git may write a lot of it on a
+    # damaged repository, and a full stderr pipe would stall it mid-log
+    with tempfile.TemporaryFile() as stderr_file:
+        # Stream git's output and parse commits as they arrive instead of
+        # buffering the whole log in memory
+        proc = subprocess.Popen(cmd, cwd=repo_path, env=GIT_ENV, stdout=subprocess.PIPE,
+                                stderr=stderr_file, bufsize=GIT_LOG_BUFSIZE)
+        with _git_processes_lock:
+            _git_processes.add(proc)
         
-        # Add date filters if specified
-        if start_date and end_date:
-            cmd.extend(['--since', f'{start_date} 00:00:00', '--until', f'{end_date} 23:59:59'])
-        elif start_date:
-            cmd.extend(['--since', f'{start_date} 00:00:00'])
-        elif end_date:
-            cmd.extend(['--until', f'{end_date} 23:59:59'])
+        with proc:
+            try:
+                # Commits are parsed and handed on one pipe read at a time, which
+                # keeps per-commit overhead in the worker and writer to a minimum
+                for records in iter_git_record_batches(proc.stdout):
+                    commits = parse_git_log_records(records, application_type, repo_path)
+                    if commits:
+                        yield commits
+            except BaseException:
+                # Stopped early (interrupted, or the consumer went away), so
+                # don't wait for git to walk the rest of the history
+                proc.kill()
+                raise
+            finally:
+                with _git_processes_lock:
+                    _git_processes.discard(proc)
         
-        # If author filters are specified, add them to the command
-        if author_filters:
-            for author in author_filters:
-                cmd.extend(['--author', author])
+        if proc.returncode != 0:
+            stderr_file.seek(0)
+            raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr_file.read())
+
+def resolve_commits(repo_path, *revisions):
+    """Resolve revisions to commit hashes, or return None if any of them is unknown"""
+    cmd = ['git', 'rev-parse'] + [f'{revision}^{{commit}}' for revision in revisions]
+    result = subprocess.run(cmd, cwd=repo_path, env=GIT_ENV, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return result.stdout.splitlines()
+
+def resolve_heads(repo_path, last_head=None):
+    """Return the current HEAD hash and last_head if that commit still exists"""
+    if last_head:
+        hashes = resolve_commits(repo_path, 'HEAD', last_head)
+        if hashes:
+            return hashes[0], hashes[1]
+        # History was rewritten and the recorded HEAD is gone; log it all again
+    hashes = resolve_commits(repo_path, 'HEAD')
+    return (hashes[0] if hashes else None), None
+
+def put_unless_stopped(commit_queue, item, stop):
+    """Put item on a bounded queue, giving up once stop is set; return whether it was queued"""
+    while not stop.is_set():
+        try:
+            commit_queue.put(item, timeout=QUEUE_PUT_TIMEOUT)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def kill_git_processes():
+    """Kill every running git log process"""
+    with _git_processes_lock:
+        processes = list(_git_processes)
+    for proc in processes:
+        proc.kill()
+
+def queue_git_log(commit_queue, stop, repo_path, author_filters, project_mapping, date_args,
+                  cache=None, cache_filters=None):
+    """Run get_git_log in a worker thread, handing its commits to the CSV writer.
+    
+    The worker gives up as soon as stop is set. With a cache, only commits
+    added since the HEAD recorded for the repository under the same
+    cache_filters are logged, and the cache entry is updated to the current HEAD.
+    """
+    count = 0
+    try:
+        if stop.is_set():
+            return
+        head = None
+        revisions = []
+        if cache is not None:
+            entry = cache.get(repo_path, {})
+            # A HEAD recorded under other filters says nothing about which
+            # commits this run would export, so start from scratch
+            last_head = entry.get('head') if entry.get('filters') == cache_filters else None
+            head, last_head = resolve_heads(repo_path, last_head)
+            if head and head == last_head:
+                log(f"  No new commits in {repo_path} since last run")
+                return
+            if head:
+                revisions = [f'{last_head}..{head}' if last_head else head]
         
-        result = subprocess.run(cmd, cwd=repo_path, capture_output=True, text=True)
+        for commits in get_git_log(repo_path, author_filters, project_mapping, date_args, revisions):
+            if not put_unless_stopped(commit_queue, commits, stop):
+                return
+            count += len(commits)
+        log(f"  Found {count} commits in {repo_path}")
         
-        if result.returncode == 0:
-            # Get application type from project mapping
-            application_type = project_mapping.get(repo_path, '')
-            
-            for line in result.stdout.strip().split('\n'):
-                if line:
-                    parts = line.split('|', 4)
-                    if len(parts) == 5:
-                        commit_hash, author_name, author_email, date, message = parts
-                        # Format date to remove timezone
-                        formatted_date = format_date_without_timezone(date)
-                        commits.append({
-                            'date': formatted_date,
-                            'author_name': author_name,
-                            'author_email': author_email,
-                            'Application_type': application_type,
-                            'Description_Technical': message.replace('\n', ' ').replace('\r', ' '),
-                            'commit_hash': commit_hash,
-                            'project_path': repo_path
-                        })
-        else:
-            print(f"Error getting git log from {repo_path}: {result.stderr}")
-    
+        # Only a clean git log run may move the recorded HEAD forward
+        if head:
+            cache[repo_path] = {'is_git': True, 'head': head, 'filters': cache_filters}
+    except subprocess.CalledProcessError as e:
+        # git is killed on purpose when the run is being stopped
+        if not stop.is_set():
+            log(f"Error getting git log from {repo_path}: {e.stderr.decode('utf-8', 'replace')}")
     except Exception as e:
-        print(f"Exception while processing {repo_path}: {str(e)}")
-    
-    return commits
+        # Also covers resolving HEAD, e.g. git missing or the path gone; the
+        # pool's futures are never inspected, so nothing may escape silently
+        log(f"Exception while processing {repo_path}: {str(e)}")
+    finally:
+        put_unless_stopped(commit_queue, _REPO_DONE, stop)
 
-def save_to_csv(commits, output_file):
-    """Save commits data to CSV file"""
-    fieldnames = ['commit_hash', 'author_name', 'author_email', 'date', 'Application_type', 'Description_Technical', 'project_path']
-    
+def iter_queued_commits(commit_queues):
+    """Yield queued commit batches repository by repository, in project list order"""
+    for commit_queue in commit_queues:
+        while True:
+            commits = commit_queue.get()
+            if commits is _REPO_DONE:
+                break
+            yield commits
+
+def load_cache(cache_file):
+    """Load the incremental run cache, or an empty one if it is missing or invalid"""
+    try:
+        cache = load_json_file(cache_file)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"Warning: Ignoring unreadable cache {cache_file}: {str(e)}")
+        return {}
+    if not isinstance(cache, dict):
+        return {}
+    # Drop malformed entries (hand-edited or stale files), so those
+    # repositories are simply exported in full again
+    return {path: entry for path, entry in cache.items()
+            if isinstance(entry, dict) and isinstance(entry.get('head'), str)}
+
+def save_cache(cache, cache_file):
+    """Write the incremental run cache"""
+    try:
+        Path(cache_file).parent.mkdir(parents=True, exist_ok=True)
+        with open(cache_file, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, indent=2)
+    except Exception as e:
+        print(f"Error saving cache: {str(e)}")
+
+def save_to_csv(commit_batches, output_file):
+    """Stream batches of commits to CSV file and return the number of rows written, or None on error"""
+    # Rows go to a temporary name first, so an interrupted or failed run
+    # never leaves a truncated file that looks like a complete export
+    partial_file = output_file + '.part'
+    count = 0
     try:
         # Create output directory if it doesn't exist
         output_dir = Path(output_file).parent
         output_dir.mkdir(parents=True, exist_ok=True)
         
-        with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            
-            for commit in commits:
-                # Reorder the commit data to match fieldnames
-                row = {
-                    'author_email': commit['author_email'],
-                    'date': commit['date'],
-                    'Application_type': commit['Application_type'],
-                    'Description_Technical': commit['Description_Technical'],
-                    'project_path': commit['project_path'],
-                    'commit_hash': commit['commit_hash'],
-                    'author_name': commit['author_name']
-                }
-                writer.writerow(row)
-        print(f"Successfully saved {len(commits)} commits to {output_file}")
-    except Exception as e:
+        # Rows collect in one large buffer that is only flushed when full or
+        # when the file is closed, never per row
+        buffered = io.BufferedWriter(io.FileIO(partial_file, 'w'), buffer_size=CSV_BUFSIZE)
+        with io.TextIOWrapper(buffered, encoding='utf-8', newline='', write_through=False) as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(Commit._fields)
+            # Commit tuples are already in column order
+            for commits in commit_batches:
+                writer.writerows(commits)
+                count += len(commits)
+        
+        if count:
+            os.replace(partial_file, output_file)
+            print(f"Successfully saved {count} commits to {output_file}")
+        else:
+            # Don't leave a header-only file behind
+            os.remove(partial_file)
+    except BaseException as e:
+        with contextlib.suppress(OSError):
+            os.remove(partial_file)
+        # Let Ctrl-C and friends propagate once the partial file is gone
+        if not isinstance(e, Exception):
+            raise
         print(f"Error saving to CSV: {str(e)}")
+        return None
+    
+    return count
 
 def main():
     """Main function to process all git repositories and generate CSV"""
@@ -208,6 +508,10 @@ Examples:
                        help='Filter commits to today only')
     parser.add_argument('dates', nargs='*', type=parse_date, 
                        help='Date(s) in YYYY-MM-DD format. One date for specific day, two dates for range.')
+    parser.add_argument('-j', '--jobs', type=int, default=DEFAULT_JOBS,
+                       help=f'Number of repositories to process in parallel (default: {DEFAULT_JOBS})')
+    parser.add_argument('--incremental', action='store_true',
+                       help=f'Only export commits added since the previous --incremental run (state kept in {CACHE_FILE})')
     
     args = parser.parse_args()
     
@@ -218,6 +522,9 @@ Examples:
     if len(args.dates) > 2:
         parser.error("Too many date arguments. Provide at most 2 dates for a range.")
     
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    
     print("Starting Git Activity to CSV conversion...")
     
     # Process date arguments
@@ -237,6 +544,8 @@ Examples:
     else:
         print("No date filter applied - processing all commits")
     
+    date_args = build_date_args(start_date, end_date, date_mode)
+    
     # Get author filters from environment
     author_filters = get_author_filters()
     print(f"Author filters: {author_filters}")
@@ -244,20 +553,27 @@ Examples:
     # Read project list
     project_list_file = 'list_project.json'
     projects, project_mapping = read_project_list(project_list_file)
-    print(f"Found {len(projects)} projects to process")
     
-    if not projects:
-        print("No valid projects found. Exiting.")
-        return
-    
-    # Collect all commits from all projects
-    all_commits = []
+    # Incremental runs remember each repository's HEAD from the previous run,
+    # along with the filters that limited what was exported up to it
+    cache = load_cache(CACHE_FILE) if args.incremental else None
+    cache_filters = {'date_args': date_args, 'author_filters': author_filters}
     
+    # Validate every project before starting git, so pool slots only go to
+    # real repositories and each worker can launch git log straight away
+    repositories = []
     for project_path in projects:
-        print(f"Processing: {project_path}")
-        commits = get_git_log(project_path, author_filters, project_mapping, start_date, end_date)
-        all_commits.extend(commits)
-        print(f"  Found {len(commits)} commits")
+        # Repositories recorded in the cache are known to be valid
+        known_repository = cache is not None and cache.get(project_path, {}).get('is_git')
+        if known_repository or is_git_repository(project_path):
+            repositories.append(project_path)
+        else:
+            print(f"Warning: {project_path} is not a git repository")
+    print(f"Found {len(repositories)} projects to process")
+    
+    if not repositories:
+        print("No valid projects found. Exiting.")
+        return
     
     # Generate output filename with timestamp and save to output folder
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -273,12 +589,33 @@ Examples:
     else:
         output_file = f'output/git_log_{timestamp}.csv'
     
-    # Save to CSV
-    if all_commits:
-        save_to_csv(all_commits, output_file)
-        print(f"\nTotal commits processed: {len(all_commits)}")
+    # Each repository is independent, so run git log for them in parallel.
+    # Every worker has its own queue and this thread streams them to the CSV
+    # one after another, so rows stay grouped in project list order.
+    commit_queues = [queue.Queue(maxsize=COMMIT_QUEUE_SIZE) for _ in repositories]
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=min(args.jobs, len(repositories))) as executor:
+        try:
+            for project_path, commit_queue in zip(repositories, commit_queues):
+                log(f"Processing: {project_path}")
+                executor.submit(queue_git_log, commit_queue, stop, project_path, author_filters,
+                                project_mapping, date_args, cache, cache_filters)
+            
+            total_commits = save_to_csv(iter_queued_commits(commit_queues), output_file)
+        finally:
+            # Release any worker still running, e.g. after Ctrl-C or a failed
+            # write, so the pool can shut down instead of waiting on full queues
+            stop.set()
+            kill_git_processes()
+    
+    # Only move the recorded HEADs forward once their commits are on disk
+    if cache is not None and total_commits is not None:
+        save_cache(cache, CACHE_FILE)
+    
+    if total_commits:
+        print(f"\nTotal commits processed: {total_commits}")
         print(f"Output file: {output_file}")
-    else:
+    elif total_commits == 0:
         print("No commits found matching the criteria.")
 
 if __name__ == "__main__":